@@ -1,12 +1,12 @@
 # app_v4.0.py
-import os
+import csv
+import re
 from datetime import datetime
 
 import joblib
 import numpy as np
-import pandas as pd
-import plotly.express as px
 import streamlit as st
+from sklearn.feature_extraction.text import HashingVectorizer
 
 # ---------------------------
 # Config / translation maps
@@ -56,20 +56,131 @@ species_keywords = {
     "cow": ["cow", "ගවයා", "cattle", "ගෝමිය"],
 }
 
+# confidence (%) lower bound -> (card color, advice, triggers serious-condition alert); checked top-down
+risk_levels = [
+    (50, "#E74C3C", "🔴 👉 Visit a qualified vet immediately. වෛද්‍යවරයෙකු වෙත ගිය යුතුය.", True),
+    (20, "#F39C12", "🟠 Possible but less likely. Monitor carefully. සතුන්ගේ තත්ත්වය නිරීක්ෂණය කරන්න.", False),
+    (0, "#27AE60", "🟢 Mild risk. Observe for new symptoms. අඩු අවදානමක් ඇත.", False),
+]
+
+# single-pass matcher over all species keywords; the named group that matched is the species
+species_re = re.compile(
+    "|".join(f"(?P<{sp}>{'|'.join(map(re.escape, keys))})" for sp, keys in species_keywords.items()),
+    re.IGNORECASE,
+)
+
 # ---------------------------
 # Load model components
 # ---------------------------
-try:
+@st.cache_resource
+def load_artifacts():
+    # loaded once per process; reruns reuse the same objects
     model = joblib.load("real_animal_disease_model.joblib")
     le = joblib.load("label_encoder.joblib")
-    vectorizer = joblib.load("vectorizer.joblib")
+    # stateless hashing featurizer; must use the same params as train_model.py
+    vectorizer = HashingVectorizer(n_features=2**20, alternate_sign=False, ngram_range=(1, 2))
+    # map model.classes_ to disease names (label encoder inverse)
+    try:
+        classes = le.inverse_transform(model.classes_)
+    except Exception:
+        # fallback: le.classes_ (should normally work)
+        classes = le.classes_
+    # species-aware penalty mask per detectable species, aligned with classes:
+    # diseases of another species are penalized strongly, multi-species like 'dog_cat' allow each part
+    disease_species_sets = {d: frozenset(v.split("_")) for d, v in disease_species.items()}
+    class_species = [disease_species_sets.get(c) for c in classes]
+    species_masks = {
+        sp: np.array([1.0 if (cs is None or sp in cs) else 0.05 for cs in class_species])
+        for sp in species_keywords
+    }
+    species_masks[None] = np.ones(len(classes))
+    # hash buckets that carry a learned weight (works for dense or sparsified coef_)
+    known_features = np.asarray(abs(model.coef_).sum(axis=0)).ravel() > 0
+    # display name "Disease (Sinhala name)" per class
+    bilingual_names = {c: f"{c} ({disease_si.get(c.strip().lower(), '— සිංහල නාමය නොමැත —')})" for c in classes}
+    return model, vectorizer, classes, species_masks, bilingual_names, known_features
+
+
+try:
+    model, vectorizer, classes, species_masks, bilingual_names, known_features = load_artifacts()
 except Exception as e:
     st.error(
         "Model files not found or failed to load. Ensure the files are in this folder:\n"
-        "real_animal_disease_model.joblib\nlabel_encoder.joblib\nvectorizer.joblib"
+        "real_animal_disease_model.joblib\nlabel_encoder.joblib"
     )
     st.stop()
 
+# ---------------------------
+# Diagnosis pipeline (memoized per input text)
+# ---------------------------
+@st.cache_data(max_entries=1024)
+def diagnose(text):
+    # returns (detected_species, top3 [(disease, prob), ...]) or None for invalid symptoms
+    # vectorize and predict
+    X = vectorizer.transform([text])  # vectorizer lowercases itself
+    probs = model.predict_proba(X)[0]  # order corresponds to model.classes_ / classes
+
+    # validation: no input feature carries a learned weight -> likely invalid symptoms
+    if not known_features[X.indices].any():
+        return None
+
+    # detect species from input
+    m = species_re.search(text)
+    detected_species = m.lastgroup if m else None
+
+    # Post-prediction species-aware filtering
+    adjusted = probs * species_masks[detected_species]
+
+    total = adjusted.sum()
+    if total <= 0:
+        # fallback to original probs normalized
+        adjusted = probs.copy()
+        total = adjusted.sum() or 1.0
+    adjusted /= total  # in place; adjusted is already a fresh array
+
+    # pick top-3 without a full sort, then order just those three
+    k = min(3, len(adjusted))
+    top_idx = np.argpartition(-adjusted, k - 1)[:k]
+    top_idx = top_idx[np.argsort(-adjusted[top_idx])]
+    return detected_species, [(str(classes[i]), float(adjusted[i])) for i in top_idx]
+
+
+# ---------------------------
+# Confidence chart (plotly is imported on first diagnosis only)
+# ---------------------------
+@st.cache_resource
+def chart_layout():
+    import plotly.graph_objects as go
+
+    # static styling for the confidence chart; only the bar data changes per diagnosis
+    return go.Layout(
+        title=dict(text="📊 Confidence Comparison (විශ්වාස තත්ත්වය)", font_size=18),
+        yaxis=dict(title="Confidence (%)"),
+        xaxis=dict(title="Disease (රෝගය)", tickangle=-30),
+        showlegend=False,
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+    )
+
+
+def confidence_chart(chart_rows):
+    import plotly.graph_objects as go
+
+    return go.Figure(
+        go.Bar(
+            x=[r["Disease"] for r in chart_rows],
+            y=[r["Confidence (%)"] for r in chart_rows],
+            text=[f"{r['Confidence (%)']:.1f}%" for r in chart_rows],
+            textposition="outside",
+            marker=dict(
+                color=[r["Color"] for r in chart_rows],
+                line=dict(width=1.2, color="#2C3E50"),
+            ),
+        ),
+        layout=chart_layout(),
+    )
+
+
 # ---------------------------
 # Streamlit config + mobile CSS
 # ---------------------------
@@ -106,149 +217,70 @@ st.markdown(
 # ---------------------------
 # Input area
 # ---------------------------
-user_input = st.text_input(
-    "👉 Type here / මෙතන ලියා දෙන්න:",
-    "",
-    placeholder="dog fever vomiting diarrhea  — or —  බල්ලා උණ වමන",
-)
+# form: typing does not rerun the script, only submitting does
+with st.form("diagnose_form"):
+    user_input = st.text_input(
+        "👉 Type here / මෙතන ලියා දෙන්න:",
+        "",
+        placeholder="dog fever vomiting diarrhea  — or —  බල්ලා උණ වමන",
+    )
+    submitted = st.form_submit_button("🔍 Diagnose / විශ්ලේෂණය කරන්න")
 
-if st.button("🔍 Diagnose / විශ්ලේෂණය කරන්න"):
+if submitted:
     if not user_input.strip():
         st.warning("Please enter symptoms / කරුණාකර රෝග ලක්ෂණ ඇතුලත් කරන්න.")
     else:
-        # vectorize and predict
-        X = vectorizer.transform([user_input.lower()])
-        probs = model.predict_proba(X)[0]  # order corresponds to model.classes_
-        # map model.classes_ to disease names (label encoder inverse)
-        try:
-            classes = le.inverse_transform(model.classes_)
-        except Exception:
-            # fallback: le.classes_ (should normally work)
-            classes = le.classes_
-
-        # create dataframe of all classes + probs
-        all_df = pd.DataFrame({"disease": classes, "prob": probs})
-        all_df = all_df.sort_values("prob", ascending=False).reset_index(drop=True)
-
-        # validation: if max prob < threshold -> likely invalid symptoms
-        if all_df.loc[0, "prob"] < 0.10:
+        result = diagnose(user_input)
+        if result is None:
             st.error("❌ කරුණාකර නිවැරදි රෝග ලක්ෂණ ඇතුළත් කරන්න! / Please enter valid disease symptoms.")
         else:
-            # detect species from input
-            txt = user_input.lower()
-            detected_species = None
-            for sp, keys in species_keywords.items():
-                for k in keys:
-                    if k in txt:
-                        detected_species = sp
-                        break
-                if detected_species:
-                    break
-
-            # Post-prediction species-aware filtering
-            adjusted = []
-            for _, row in all_df.iterrows():
-                d = row["disease"]
-                p = float(row["prob"])
-                dspecies = disease_species.get(d, None)
-                if detected_species and dspecies:
-                    # if disease is multi-species like 'dog_cat' -> split and allow multiple
-                    if "_" in dspecies:
-                        parts = dspecies.split("_")
-                        if detected_species not in parts:
-                            # penalize strongly
-                            p *= 0.05
-                    else:
-                        if detected_species != dspecies:
-                            p *= 0.05
-                adjusted.append((d, p))
-
-            total = sum([p for _, p in adjusted])
-            if total <= 0:
-                # fallback to original probs normalized
-                adjusted = [(d, p) for d, p in adjusted]
-                total = sum([p for _, p in adjusted]) or 1.0
-            adjusted = [(d, p / total) for d, p in adjusted]
-
-            # sort and pick top-3
-            adjusted_sorted = sorted(adjusted, key=lambda x: x[1], reverse=True)
-            top3 = adjusted_sorted[:3]
+            detected_species, top3 = result
 
             # Display results
             st.markdown("<h3 style='color:#2E86C1;'>🩺 Sambhāvanā Rōga (Top-3 Probable Diseases):</h3>", unsafe_allow_html=True)
             chart_rows = []
+            card_html = []
             alert_triggered = False
 
             for i, (disease, prob) in enumerate(top3):
                 conf = prob * 100
-                key = disease.strip().lower()
-                siname = disease_si.get(key, "— සිංහල නාමය නොමැත —")
-                bilingual = f"{disease} ({siname})"
-
-                if conf >= 50:
-                    color = "#E74C3C"
-                    advice = "🔴 👉 Visit a qualified vet immediately. වෛද්‍යවරයෙකු වෙත ගිය යුතුය."
-                    alert_triggered = True
-                elif conf >= 20:
-                    color = "#F39C12"
-                    advice = "🟠 Possible but less likely. Monitor carefully. සතුන්ගේ තත්ත්වය නිරීක්ෂණය කරන්න."
-                else:
-                    color = "#27AE60"
-                    advice = "🟢 Mild risk. Observe for new symptoms. අඩු අවදානමක් ඇත."
-
-                # render card
-                st.markdown(
+                bilingual = bilingual_names[disease]
+                color, advice, serious = next((c, a, s) for t, c, a, s in risk_levels if conf >= t)
+                alert_triggered = alert_triggered or serious
+
+                # build card; all cards are rendered in one st.markdown call below
+                card_html.append(
                     f"""
                     <div style="background-color:{color}15; border-left:6px solid {color}; border-radius:12px; padding:12px; margin-bottom:10px;">
                         <h4 style="color:{color}; font-size:20px; margin-bottom:6px;">{i+1}. {bilingual} — {conf:.1f}%</h4>
                         <p style="font-size:15px; color:{color}; font-weight:500;">{advice}</p>
                     </div>
-                    """,
-                    unsafe_allow_html=True,
+                    """
                 )
 
                 chart_rows.append({"Disease": bilingual, "Confidence (%)": conf, "Color": color})
 
+            st.markdown("".join(card_html), unsafe_allow_html=True)
+
             # Notification banner for serious cases
             if alert_triggered:
                 st.markdown("<div class='alert'>🚨 Serious condition detected! වහාම වෛද්‍යවරයෙකු වෙත ගිය යුතුය!</div>", unsafe_allow_html=True)
 
             # Chart
-            df_chart = pd.DataFrame(chart_rows)
-            fig = px.bar(
-                df_chart,
-                x="Disease",
-                y="Confidence (%)",
-                color="Color",
-                color_discrete_map={c: c for c in df_chart["Color"]},
-                text=df_chart["Confidence (%)"].round(1).astype(str) + "%",
-                title="📊 Confidence Comparison (විශ්වාස තත්ත්වය)",
-            )
-            fig.update_traces(textposition="outside", marker_line_width=1.2, marker_line_color="#2C3E50")
-            fig.update_layout(
-                title_font_size=18,
-                yaxis=dict(title="Confidence (%)"),
-                xaxis=dict(title="Disease (රෝගය)", tickangle=-30),
-                showlegend=False,
-                plot_bgcolor="rgba(0,0,0,0)",
-                paper_bgcolor="rgba(0,0,0,0)",
-            )
+            fig = confidence_chart(chart_rows)
             st.plotly_chart(fig, use_container_width=True)
 
             # Save diagnosis history (append)
             try:
                 hist_file = "diagnosis_history.csv"
                 preds_text = ";".join([f"{r['Disease']}|{r['Confidence (%)']:.1f}%" for r in chart_rows])
-                history_row = {
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "input": user_input,
-                    "species_detected": detected_species or "",
-                    "predictions": preds_text,
-                }
-                if not os.path.exists(hist_file):
-                    pd.DataFrame([history_row]).to_csv(hist_file, index=False)
-                else:
-                    pd.DataFrame([history_row]).to_csv(hist_file, mode="a", header=False, index=False)
+                history_row = [datetime.utcnow().isoformat(), user_input, detected_species or "", preds_text]
+                with open(hist_file, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)  # default \r\n rows, same as the existing history file
+                    # append-mode position is 0 only for a new (empty) file -> write header first
+                    if f.tell() == 0:
+                        writer.writerow(["timestamp", "input", "species_detected", "predictions"])
+                    writer.writerow(history_row)
                 st.caption("🔒 Diagnosis saved to diagnosis_history.csv")
             except Exception:
                 pass
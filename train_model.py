@@ -1,22 +1,32 @@
 import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import joblib
 
-df = pd.read_csv("real_animal_disease_dataset.csv")
-df['text'] = df['species'] + ' ' + df['symptoms']
+df = pd.read_csv("real_animal_disease_dataset_bilingual.csv")
+df['text'] = df['symptoms']
 
-vectorizer = CountVectorizer()
-X = vectorizer.fit_transform(df['text'])
+# stateless hashing featurizer (nothing to fit or persist); app.py builds the same one
+vectorizer = HashingVectorizer(n_features=2**20, alternate_sign=False, ngram_range=(1, 2))
+X = vectorizer.transform(df['text'])
 le = LabelEncoder()
 y = le.fit_transform(df['disease'])
 
-model = RandomForestClassifier(n_estimators=150, random_state=42)
+X_tr, X_te, y_tr, y_te = train_test_split(X, y, test_size=0.2, stratify=y, random_state=42)
+
+# linear model works directly on the sparse text matrix; predict_proba is a single sparse dot product
+model = LogisticRegression(max_iter=1000, C=1.0, class_weight="balanced")
+model.fit(X_tr, y_tr)
+print(f"Hold-out accuracy: {model.score(X_te, y_te):.3f}")
+
+# final model uses all rows
 model.fit(X, y)
+# only a few hundred of the hash buckets carry weights; keep coef_ sparse in memory and on disk
+model.sparsify()
 
-joblib.dump(model, "real_animal_disease_model.joblib")
-joblib.dump(le, "label_encoder.joblib")
-joblib.dump(vectorizer, "vectorizer.joblib")
+joblib.dump(model, "real_animal_disease_model.joblib", compress=3)
+joblib.dump(le, "label_encoder.joblib", compress=3)
 
 print("✅ Model trained and saved.")